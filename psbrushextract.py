@@ -3,43 +3,180 @@
 # License: AGPLv3
 # Contact: inquiry@morrowshore.com
 
+import argparse
 import struct
+import os
+import sys
 
-def parse_brush_parameters(data):
+from psbrushprogress import ExtractionCancelled, ProgressTracker, print_progress_bar
 
+TYPE_MARKERS = {
+    b'UntF': 'UntF', # contains values - done
+    b'bool': 'bool', # contains values - done
+    b'long': 'long', # contains values - done
+    b'doub': 'doub', # contains values - probably done
+    b'enum': 'enum', # contains modes - done
+    b'TEXT': 'TEXT', # contains text - done
+    b'Objc': 'Objc', # indicator of a set containing curves & dynamics - not fully done
+    b'VlLs': 'VlLs'  # ?
+}
+
+def find_printable_key_before(data, pos, max_lookback=50):
+    start = max(0, pos - max_lookback)
+    segment = data[start:pos]
     
-    results = []
-    L = len(data)
+    key = ""
+    for i in range(len(segment) - 1, -1, -1):
+        if 32 <= segment[i] <= 126:  
+            key = chr(segment[i]) + key
+        else:
+            break
+    
+    return key.strip()
+
+class SkippedSpan:
+    # A region the parser stepped over, kept as offset and length only.
+    # The hex dump is rendered from the original data when formatting.
+    __slots__ = ('label', 'offset', 'length')
+    
+    def __init__(self, label, offset, length):
+        self.label = label
+        self.offset = offset
+        self.length = length
+    
+    def render(self, data=None, hex_limit=None):
+        if hex_limit is not None and hex_limit < 0:
+            raise ValueError(f"Hex limit must not be negative, got {hex_limit}")
+        if data is None or hex_limit == 0:
+            return f"{self.label} [offset={self.offset}, length={self.length}]"
+        
+        view = memoryview(data)
+        if hex_limit is None or self.length <= hex_limit:
+            return f"{self.label} (0x{view[self.offset:self.offset + self.length].hex()})"
+        
+        shown = view[self.offset:self.offset + hex_limit].hex()
+        return f"{self.label} (0x{shown}... +{self.length - hex_limit} bytes)"
+    
+    def __str__(self):
+        return self.render()
     
+    def __repr__(self):
+        return f"SkippedSpan({self.label!r}, {self.offset}, {self.length})"
+    
+    def __eq__(self, other):
+        if not isinstance(other, SkippedSpan):
+            return NotImplemented
+        return (self.label, self.offset, self.length) == (other.label, other.offset, other.length)
+
+def find_next_marker(data, pos):
+    next_pos = len(data)
+    for next_marker in TYPE_MARKERS.keys():
+        found_next = data.find(next_marker, pos)
+        if found_next != -1:
+            next_pos = min(next_pos, found_next)
+    return next_pos
+
+def parse_brush_parameters(data, workers=1, detail='normal', progress=None, cancel=None):
+    # progress is called with a psbrushprogress.Progress; setting the cancel
+    # event makes parsing raise ExtractionCancelled.
     pos = data.find(b'Objc')
     if pos == -1:
-        return results  
-    
-    type_markers = {
-        b'UntF': 'UntF', # contains values - done
-        b'bool': 'bool', # contains values - done
-        b'long': 'long', # contains values - done
-        b'doub': 'doub', # contains values - probably done
-        b'enum': 'enum', # contains modes - done
-        b'TEXT': 'TEXT', # contains text - done
-        b'Objc': 'Objc', # indicator of a set containing curves & dynamics - not fully done
-        b'VlLs': 'VlLs'  # ?
-    }
-    
-    def find_printable_key_before(data, pos, max_lookback=50):
-        start = max(0, pos - max_lookback)
-        segment = data[start:pos]
-        
-        key = ""
-        for i in range(len(segment) - 1, -1, -1):
-            if 32 <= segment[i] <= 126:  
-                key = chr(segment[i]) + key
-            else:
-                break
+        return []
+    
+    tracker = None
+    if progress is not None or cancel is not None:
+        tracker = ProgressTracker('parse', len(data), progress, cancel, bytes_start=pos)
+    
+    if workers is None or workers > 1:
+        boundaries = find_preset_boundaries(data, pos, workers or os.cpu_count() or 1)
+        if len(boundaries) > 1:
+            results = parse_chunks_parallel(data, boundaries, workers, detail, tracker)
+            if tracker is not None:
+                tracker.finish()
+            return results
+    
+    results, pos = parse_range(data, pos, len(data), detail, tracker)
+    if tracker is not None:
+        tracker.update(pos, count_presets(results))
+        tracker.finish()
+    return results
+
+def count_presets(results):
+    return sum(1 for key, param_type, value in results if param_type == 'Objc' and value == 'brushPreset')
+
+def find_preset_boundaries(data, pos, workers):
+    # Each preset in the 'desc' list starts with an Objc marker followed by
+    # the brushPreset class id. The presets are grouped so that each worker
+    # gets a few chunks to balance uneven preset sizes.
+    starts = [pos]
+    found = data.find(b'brushPreset', pos)
+    while found != -1:
+        start = data.rfind(b'Objc', starts[-1], found)
+        if start > starts[-1]:
+            starts.append(start)
+        found = data.find(b'brushPreset', found + 11)
+    
+    per_chunk = max(1, len(starts) // (workers * 4))
+    return starts[::per_chunk]
+
+_worker_data = None
+
+def _init_parse_worker(data):
+    global _worker_data
+    _worker_data = data
+
+def _parse_chunk(start, end, detail):
+    return parse_range(_worker_data, start, end, detail)
+
+def parse_chunks_parallel(data, boundaries, workers=None, detail='normal', tracker=None):
+    from concurrent.futures import ProcessPoolExecutor
+    
+    chunks = list(zip(boundaries, boundaries[1:] + [len(data)]))
+    results = []
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker, initargs=(data,)) as pool:
+        futures = [pool.submit(_parse_chunk, start, end, detail) for start, end in chunks]
         
-        return key.strip()
+        pos = boundaries[0]
+        presets = 0
+        try:
+            for (start, end), future in zip(chunks, futures):
+                chunk_results, chunk_end = future.result()
+                if pos != start:
+                    # The previous chunk ran past this boundary, so the serial
+                    # scan resumes elsewhere; redo the chunk from that position.
+                    chunk_results, chunk_end = parse_range(data, pos, end, detail)
+                results.extend(chunk_results)
+                pos = chunk_end
+                if tracker is not None:
+                    presets += count_presets(chunk_results)
+                    tracker.update(pos, presets)
+        except ExtractionCancelled:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
     
-    while pos < L - 4:
+    return results
+
+REPORT_INTERVAL_BYTES = 64 * 1024
+
+def parse_range(data, pos, end, detail='normal', tracker=None):
+    # detail='dev' keeps enum codes and whole Objc regions as raw spans
+    # instead of decoding their class and value names.
+    results = []
+    L = len(data)
+    type_markers = TYPE_MARKERS
+    
+    next_report = pos
+    presets = 0
+    presets_counted = 0
+    
+    while pos < L - 4 and pos < end:
+        if tracker is not None and pos >= next_report:
+            presets += count_presets(results[presets_counted:])
+            presets_counted = len(results)
+            tracker.update(pos, presets)
+            next_report = pos + REPORT_INTERVAL_BYTES
+        
         found_marker = False
         
         for marker_bytes, marker_name in type_markers.items():
@@ -94,6 +231,14 @@ def parse_brush_parameters(data):
                         found_marker = True
                         break
                 
+                elif marker_name == 'enum' and detail == 'dev':
+                    if pos + 8 <= L:
+                        enum_val = data[pos+4:pos+8].decode('ascii', errors='ignore').rstrip('\x00')
+                        results.append((key, 'enum', SkippedSpan(enum_val, pos + 4, 4)))
+                        pos += 8
+                        found_marker = True
+                        break
+                
                 elif marker_name == 'enum':
                     if pos + 12 <= L:
                         enum_type = data[pos+8:pos+12].decode('ascii', errors='ignore').rstrip('\x00')
@@ -117,15 +262,17 @@ def parse_brush_parameters(data):
                         else:
                             results.append((key, 'enum', f"{enum_type}"))
                         
-                        next_pos = L
-                        for next_marker in type_markers.keys():
-                            found_next = data.find(next_marker, enum_pos)
-                            if found_next != -1:
-                                next_pos = min(next_pos, found_next)
-                        pos = next_pos
+                        pos = find_next_marker(data, enum_pos)
                         found_marker = True
                         break
                 
+                elif marker_name == 'Objc' and detail == 'dev':
+                    next_pos = find_next_marker(data, pos + 4)
+                    results.append((key, 'Objc', SkippedSpan('skipped', pos, next_pos - pos)))
+                    pos = next_pos
+                    found_marker = True
+                    break
+                
                 elif marker_name == 'Objc':
                     obj_pos = pos + 4
                     
@@ -158,13 +305,8 @@ def parse_brush_parameters(data):
                     break
                 
                 elif marker_name == 'VlLs':
-                    next_pos = L
-                    for next_marker in type_markers.keys():
-                        found_next = data.find(next_marker, pos + 4)
-                        if found_next != -1:
-                            next_pos = min(next_pos, found_next)
-                    binary_hex = data[pos:next_pos].hex()
-                    results.append((key, 'VlLs', f"skipped (0x{binary_hex})"))
+                    next_pos = find_next_marker(data, pos + 4)
+                    results.append((key, 'VlLs', SkippedSpan('skipped', pos, next_pos - pos)))
                     pos = next_pos
                     found_marker = True
                     break
@@ -172,44 +314,88 @@ def parse_brush_parameters(data):
         if not found_marker:
             pos += 1
     
-    return results
+    return results, pos
 
-def format_results(results, indent=0):
+def group_presets(results):
+    # Splits the flat parameter list at every top-level brushPreset object.
+    # Anything before the first preset belongs to the descriptor header.
+    presets = []
+    for key, param_type, value in results:
+        if param_type == 'Objc' and value == 'brushPreset':
+            presets.append({'name': "", 'sample_id': None, 'parameters': []})
+            continue
+        if not presets:
+            continue
+        preset = presets[-1]
+        if param_type == 'TEXT' and key == 'Nm' and not preset['name']:
+            preset['name'] = value
+        elif param_type == 'TEXT' and key == 'sampledData' and preset['sample_id'] is None:
+            preset['sample_id'] = value
+        preset['parameters'].append((key, param_type, value))
+    
+    return presets
+
+def format_results(results, indent=0, data=None, hex_limit=None):
+    # Skipped spans are rendered as hex from data, truncated to hex_limit
+    # bytes; without data (or with hex_limit=0) only offset and length are
+    # written.
+    if hex_limit is not None and hex_limit < 0:
+        raise ValueError(f"Hex limit must not be negative, got {hex_limit}")
     output = []
     
     for key, param_type, value in results:
+        if isinstance(value, SkippedSpan):
+            value = value.render(data, hex_limit)
         output.append(f"{key:<30}\t{param_type:<15}\t{value}")
     
     return '\n'.join(output)
 
-if __name__ == "__main__":
-    import sys
-    import os
+def export_parameters(filename, output_filename=None, workers=1, detail='normal', hex_limit=None,
+                      progress=None, cancel=None):
+    if output_filename is None:
+        output_dir = os.path.dirname(filename)
+        brush_name = os.path.splitext(os.path.basename(filename))[0]
+        output_filename = os.path.join(output_dir, f"{brush_name}_dump.txt")
     
-    if len(sys.argv) != 2:
-        print("Usage: python test2.py <brush_file.abr>")
-        sys.exit(1)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    
+    results = parse_brush_parameters(data, workers, detail, progress, cancel)
+    formatted = format_results(results, data=data, hex_limit=hex_limit)
     
-    filename = sys.argv[1]
-    output_dir = os.path.dirname(filename)
-    brush_name = os.path.splitext(os.path.basename(filename))[0]
-    output_filename = os.path.join(output_dir, f"{brush_name}_dump.txt")
+    with open(output_filename, 'w', encoding='utf-8') as out_file:
+        out_file.write(f"Parsed {filename}\n")
+        out_file.write(f"\n")
+        out_file.write(f"Tool by Morrow Shore https://morrowshore.com\n")
+        out_file.write(f"\n")
+        out_file.write("-" * 50 + "\n")
+        out_file.write(formatted)
+    
+    return output_filename
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return number
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract brush parameters from a Photoshop .abr file")
+    parser.add_argument('filename', help="path to the .abr file")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes for parsing presets (0 = CPU count, default: 1)")
+    parser.add_argument('--detail', choices=['normal', 'dev'], default='normal',
+                        help="'dev' keeps enum and Objc regions as raw spans")
+    parser.add_argument('--hex-limit', type=non_negative_int, default=None,
+                        help="truncate skipped-region hex dumps to N bytes (0 = offset and length only)")
+    args = parser.parse_args(argv)
+    
+    filename = args.filename
     
     try:
-        with open(filename, 'rb') as f:
-            data = f.read()
-        
-        results = parse_brush_parameters(data)
-        formatted = format_results(results)
-        
-        with open(output_filename, 'w', encoding='utf-8') as out_file:
-            out_file.write(f"Parsed {filename}\n")
-            out_file.write(f"\n")
-            out_file.write(f"Tool by Morrow Shore https://morrowshore.com\n")
-            out_file.write(f"\n")
-            out_file.write("-" * 50 + "\n")
-            out_file.write(formatted)
-        
+        output_filename = export_parameters(filename, workers=args.workers or None,
+                                            detail=args.detail, hex_limit=args.hex_limit,
+                                            progress=print_progress_bar)
         print(f"Successfully exported results to {output_filename}")
         
     except FileNotFoundError:
@@ -218,3 +404,6 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Error processing file: {e}")
         sys.exit(1)
+
+if __name__ == "__main__":
+    main()
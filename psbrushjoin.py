@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Author: Morrow Shore
+# License: AGPLv3
+# Contact: inquiry@morrowshore.com
+
+import argparse
+import json
+import os
+import sys
+
+from psbrushextract import parse_brush_parameters, group_presets, non_negative_int
+from psbrushprogress import print_progress_bar
+from psbrushtipextract import AbrExtractor
+
+
+def join_presets_with_tips(presets, brushes):
+    # One pass to index the tips by their 'samp' id, one pass over the
+    # presets to look up the tip referenced by their sampledData key.
+    tips = {}
+    for brush in brushes:
+        if brush.get('sample_id'):
+            tips.setdefault(brush['sample_id'], brush)
+
+    records = []
+    for i, preset in enumerate(presets):
+        tip = tips.get(preset['sample_id'])
+        records.append({
+            'preset': i + 1,
+            'name': preset['name'],
+            'sample_id': preset['sample_id'],
+            'tip': tip.get('file') if tip else None,
+            'tip_index': tip['index'] if tip else None,
+            'tip_crop': tip.get('crop') if tip else None,
+            'parameters': [list(parameter) for parameter in preset['parameters']],
+        })
+
+    return records
+
+
+def extract_joined(filename, output_dir=None, output_filename=None, workers=1, trim=False, trim_padding=0,
+                   progress=None, cancel=None):
+    base_name = os.path.splitext(os.path.basename(filename))[0]
+    if output_filename is None:
+        output_filename = os.path.join(os.path.dirname(filename), f"{base_name}_presets.json")
+
+    extractor = AbrExtractor(filename, progress=progress, cancel=cancel, verbose=progress is None,
+                             workers=workers)
+    if not extractor.extract_brushes():
+        raise ValueError("Failed to extract brushes")
+    tip_files = extractor.save_brush_images(output_dir, trim, trim_padding)
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+    presets = group_presets(parse_brush_parameters(data, workers, progress=progress, cancel=cancel))
+
+    records = join_presets_with_tips(presets, extractor.brushes)
+
+    with open(output_filename, 'w', encoding='utf-8') as out_file:
+        json.dump(records, out_file, indent=2, default=str)
+
+    return output_filename, tip_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract brush presets joined with their tip images")
+    parser.add_argument('filename', help="path to the .abr file")
+    parser.add_argument('--output-dir', help="directory for the tip images")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="workers for parsing presets and decoding tips (0 = CPU count, default: 1)")
+    parser.add_argument('--trim', action='store_true', help="crop each tip to its non-empty pixels")
+    parser.add_argument('--trim-padding', type=non_negative_int, default=0, help="pixels of margin to keep around trimmed tips")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.filename):
+        print(f"File not found: {args.filename}")
+        sys.exit(1)
+
+    try:
+        output_filename, tip_files = extract_joined(args.filename, args.output_dir, workers=args.workers or None,
+                                                trim=args.trim, trim_padding=args.trim_padding,
+                                                progress=print_progress_bar)
+        print(f"Successfully exported joined presets to {output_filename}")
+    except Exception as e:
+        print(f"Error processing file: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
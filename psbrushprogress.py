@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Author: Morrow Shore
+# License: AGPLv3
+# Contact: inquiry@morrowshore.com
+
+import sys
+import time
+from collections import namedtuple
+
+
+Progress = namedtuple('Progress', ['phase', 'bytes_done', 'bytes_total', 'brushes_done', 'brushes_total',
+                                   'rate', 'eta', 'finished'])
+
+
+class ExtractionCancelled(BaseException):
+    # Derived from BaseException, like KeyboardInterrupt, so the per-brush
+    # "except Exception" recovery in the loaders does not swallow it.
+    pass
+
+
+class ProgressTracker:
+    # Reports progress to callback(Progress) at most every interval seconds
+    # and raises ExtractionCancelled once cancel (anything with an is_set()
+    # method, e.g. threading.Event) is set.
+    def __init__(self, phase, bytes_total, callback=None, cancel=None, brushes_total=None, interval=0.1,
+                 bytes_start=0):
+        self.phase = phase
+        self.bytes_total = bytes_total
+        self.brushes_total = brushes_total
+        self.callback = callback
+        self.cancel = cancel
+        self.interval = interval
+        self.start_time = time.perf_counter()
+        self.last_report = None
+        self.bytes_start = bytes_start
+        self.bytes_done = bytes_start
+        self.brushes_done = 0
+
+    def check_cancelled(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise ExtractionCancelled(f"{self.phase} cancelled")
+
+    def update(self, bytes_done, brushes_done=None, force=False, finished=False):
+        self.check_cancelled()
+        self.bytes_done = bytes_done
+        if brushes_done is not None:
+            self.brushes_done = brushes_done
+        if self.callback is None:
+            return
+
+        now = time.perf_counter()
+        if not force and self.last_report is not None and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+
+        elapsed = now - self.start_time
+        rate = (bytes_done - self.bytes_start) / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if rate > 0 and self.bytes_total:
+            eta = max(0.0, (self.bytes_total - bytes_done) / rate)
+        self.callback(Progress(self.phase, bytes_done, self.bytes_total, self.brushes_done, self.brushes_total,
+                               rate, eta, finished))
+
+    def finish(self):
+        self.update(self.bytes_total or self.bytes_done, force=True, finished=True)
+
+
+def print_progress_bar(progress, width=30, stream=None):
+    stream = stream or sys.stderr
+    fraction = progress.bytes_done / progress.bytes_total if progress.bytes_total else 0.0
+    fraction = min(1.0, fraction)
+    filled = int(width * fraction)
+    eta = f"ETA {progress.eta:.0f}s" if progress.eta is not None else "ETA --"
+    stream.write(f"\r{progress.phase:<8} [{'#' * filled}{'.' * (width - filled)}] {fraction * 100:5.1f}% "
+                 f"{progress.brushes_done} brushes {progress.rate / (1024 * 1024):6.1f} MB/s {eta}  ")
+    if progress.finished:
+        stream.write("\n")
+    stream.flush()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# Author: Morrow Shore
+# License: AGPLv3
+# Contact: inquiry@morrowshore.com
+
+# Long-running extraction service. Reads one JSON request per line on stdin
+# and writes one JSON response per line on stdout, e.g.
+#
+#   {"id": 1, "op": "extract", "path": "brush.abr", "output_dir": "tips"}
+#   {"id": 2, "op": "parameters", "path": "brush.abr"}
+#   {"id": 3, "op": "inventory", "path": "brush.abr"}
+#   {"id": 4, "op": "join", "path": "brush.abr"}
+#
+# As with the --workers flags, "workers": 0 means one worker per CPU.
+#
+# Requests are handled concurrently by a fixed pool of worker processes, so
+# the interpreter, Pillow and the extractor modules are only loaded once per
+# worker instead of once per brush file.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def _init_worker():
+    # Responses own stdout; the extractors' progress lines go to stderr.
+    sys.stdout = sys.stderr
+
+
+def _make_extractor(request):
+    import psbrushtipextract
+
+    # 'limits' holds ResourceBudget keyword arguments, e.g.
+    # {"max_brush_pixels": 67108864, "max_file_seconds": 30}
+    budget = psbrushtipextract.ResourceBudget(**request.get('limits', {}))
+    return psbrushtipextract.AbrExtractor(request['path'], budget=budget)
+
+
+def _op_extract(request):
+    extractor = _make_extractor(request)
+    if not extractor.extract_brushes():
+        raise ValueError("Failed to extract brushes")
+    outputs = extractor.save_brush_images(request.get('output_dir'), request.get('trim', False),
+                                          request.get('trim_padding', 0))
+    crops = {brush['file']: brush['crop'] for brush in extractor.brushes if brush.get('crop')}
+    return {'outputs': outputs, 'crops': crops}
+
+
+def _op_parameters(request):
+    import psbrushextract
+
+    output_filename = psbrushextract.export_parameters(request['path'], request.get('output'),
+                                                       request.get('workers', 1) or None,
+                                                       request.get('detail', 'normal'),
+                                                       request.get('hex_limit'))
+    return {'outputs': [output_filename]}
+
+
+def _op_join(request):
+    import psbrushjoin
+
+    output_filename, tip_files = psbrushjoin.extract_joined(request['path'], request.get('output_dir'),
+                                                          request.get('output'), request.get('workers', 1) or None,
+                                                          request.get('trim', False),
+                                                          request.get('trim_padding', 0))
+    return {'outputs': [output_filename] + tip_files}
+
+
+def _op_inventory(request):
+    extractor = _make_extractor(request)
+    if not extractor.extract_brushes():
+        raise ValueError("Failed to extract brushes")
+    brushes = []
+    for brush in extractor.brushes:
+        brushes.append({key: value for key, value in brush.items() if key != 'data'})
+    return {'outputs': [], 'brushes': brushes}
+
+
+OPERATIONS = {
+    'extract': _op_extract,
+    'parameters': _op_parameters,
+    'inventory': _op_inventory,
+    'join': _op_join,
+}
+
+
+def handle_request(request):
+    start = time.perf_counter()
+    response = {'id': request.get('id'), 'op': request.get('op')}
+    try:
+        operation = OPERATIONS.get(request.get('op'))
+        if operation is None:
+            raise ValueError(f"Unknown operation: {request.get('op')}")
+        if not os.path.exists(request.get('path') or ''):
+            raise FileNotFoundError(f"File not found: {request.get('path')}")
+        response.update(operation(request))
+        response['ok'] = True
+    except Exception as e:
+        response['ok'] = False
+        response['error'] = str(e)
+    response['elapsed'] = round(time.perf_counter() - start, 6)
+    return response
+
+
+def serve(input_stream, output_stream, workers=None):
+    lock = threading.Lock()
+
+    def write_response(response):
+        line = json.dumps(response, default=str)
+        with lock:
+            output_stream.write(line + '\n')
+            output_stream.flush()
+
+    def on_done(request, future):
+        # Runs inside the executor, where an exception would be lost, so any
+        # failure is turned into an error response.
+        try:
+            try:
+                response = future.result()
+            except BrokenProcessPool as e:
+                response = {'id': request.get('id'), 'op': request.get('op'), 'ok': False,
+                            'error': f"Worker process died: {e}"}
+            except Exception as e:
+                response = {'id': request.get('id'), 'op': request.get('op'), 'ok': False, 'error': str(e)}
+            write_response(response)
+        except Exception as e:
+            traceback.print_exc()
+            write_response({'id': request.get('id'), 'op': request.get('op'), 'ok': False,
+                            'error': f"Could not send response: {e}"})
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+    pool = new_pool()
+    try:
+        for line in input_stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Request must be a JSON object")
+            except ValueError as e:
+                write_response({'id': None, 'ok': False, 'error': f"Invalid request: {e}"})
+                continue
+            try:
+                future = pool.submit(handle_request, request)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); the requests it
+                # held are answered with errors and a fresh pool takes over.
+                print("Worker pool broken, restarting it")
+                pool.shutdown(wait=False)
+                pool = new_pool()
+                future = pool.submit(handle_request, request)
+            future.add_done_callback(lambda future, request=request: on_done(request, future))
+    finally:
+        pool.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve brush extraction requests over stdin/stdout JSON lines")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    output_stream = sys.stdout
+    sys.stdout = sys.stderr
+    serve(sys.stdin, output_stream, args.workers)
+
+
+if __name__ == "__main__":
+    main()
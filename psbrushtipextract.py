@@ -3,18 +3,241 @@
 # License: AGPLv3
 # Contact: inquiry@morrowshore.com
 
+import argparse
 import struct
 import os
 import sys
 from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+from concurrent.futures import ProcessPoolExecutor, wait
+from psbrushextract import non_negative_int
+from psbrushprogress import ProgressTracker, print_progress_bar
 import io
+import mmap
+import time
+import zlib
+
+
+# Repeat runs are at most 128 bytes long, so every run is a prefix of one of
+# these.
+RLE_RUNS = [memoryview(bytes([value]) * 128) for value in range(256)]
+
+# Tips taller than this, or larger than max_buffered_bytes, are not held in
+# memory; they are decoded in strips of strip_rows rows straight into the PNG.
+MAX_BUFFERED_HEIGHT = 16384
+
+
+class PngStreamWriter:
+    # Minimal PNG encoder that takes the image a few rows at a time, so the
+    # whole bitmap never has to exist in memory. The image is written to a
+    # temporary file that only replaces path once every row is in, so a failed
+    # decode never leaves a truncated PNG behind.
+    COLOR_TYPES = {'L': (0, 1), 'RGBA': (6, 4)}
+
+    def __init__(self, path, width, height, mode, chunk_size=1 << 16):
+        color_type, self.bytes_per_pixel = self.COLOR_TYPES[mode]
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.chunk_size = chunk_size
+        self.pending = []
+        self.pending_size = 0
+        self.compressor = zlib.compressobj()
+        self.path = path
+        self.temp_path = path + '.part'
+        self.f = open(self.temp_path, 'wb')
+        self.f.write(b'\x89PNG\r\n\x1a\n')
+        self.write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+
+    def write_chunk(self, chunk_type, data):
+        self.f.write(struct.pack('>I', len(data)))
+        self.f.write(chunk_type)
+        self.f.write(data)
+        self.f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def write_rows(self, data, row_count):
+        stride = self.width * self.bytes_per_pixel
+        view = memoryview(data)
+        for row in range(row_count):
+            self.add_compressed(self.compressor.compress(b'\x00'))
+            self.add_compressed(self.compressor.compress(view[row * stride:(row + 1) * stride]))
+        self.rows_written += row_count
+
+    def add_compressed(self, data):
+        if not data:
+            return
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= self.chunk_size:
+            self.flush_pending()
+
+    def flush_pending(self):
+        if self.pending:
+            self.write_chunk(b'IDAT', b''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"PNG has {self.rows_written} of {self.height} rows")
+        self.add_compressed(self.compressor.flush())
+        self.flush_pending()
+        self.write_chunk(b'IEND', b'')
+        self.f.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class MappedReader:
+    # File-like reader over a read-only mmap of the file, used by the tip
+    # decoding workers.
+    def __init__(self, mapping, pos=0):
+        self.mapping = mapping
+        self.pos = pos
+
+    def read(self, size):
+        data = self.mapping[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = max(0, min(len(buffer), len(self.mapping) - self.pos))
+        with memoryview(self.mapping) as view:
+            buffer[:count] = view[self.pos:self.pos + count]
+        self.pos += count
+        return count
+
+    def seek(self, pos, whence=0):
+        self.pos = pos if whence == 0 else self.pos + pos
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+
+class BudgetExceeded(ValueError):
+    pass
+
+
+class FileBudgetExceeded(BudgetExceeded):
+    # A per-file limit was hit, so no further brush of the file can be
+    # processed either.
+    pass
+
+
+class ResourceBudget:
+    # Per-file and per-brush ceilings on decoded bytes, decoded pixels and
+    # wall time. A limit of None is not enforced.
+    def __init__(self, max_file_bytes=None, max_file_pixels=None, max_file_seconds=None,
+                 max_brush_bytes=None, max_brush_pixels=None, max_brush_seconds=None):
+        self.max_file_bytes = max_file_bytes
+        self.max_file_pixels = max_file_pixels
+        self.max_file_seconds = max_file_seconds
+        self.max_brush_bytes = max_brush_bytes
+        self.max_brush_pixels = max_brush_pixels
+        self.max_brush_seconds = max_brush_seconds
+        self.start_file()
+
+    def start_file(self):
+        self.file_start = time.perf_counter()
+        self.file_bytes = 0
+        self.file_pixels = 0
+        self.start_brush()
+
+    def start_brush(self):
+        self.brush_start = time.perf_counter()
+        self.brush_bytes = 0
+        self.brush_pixels = 0
+
+    def allocate(self, nbytes, pixels):
+        self.brush_bytes += nbytes
+        self.brush_pixels += pixels
+        self.file_bytes += nbytes
+        self.file_pixels += pixels
+        self.check_file()
+        self.check_limit(self.brush_bytes, self.max_brush_bytes, "Brush byte")
+        self.check_limit(self.brush_pixels, self.max_brush_pixels, "Brush pixel")
+
+    def check_file(self):
+        self.check_limit(self.file_bytes, self.max_file_bytes, "File byte", FileBudgetExceeded)
+        self.check_limit(self.file_pixels, self.max_file_pixels, "File pixel", FileBudgetExceeded)
+        self.check_limit(time.perf_counter() - self.file_start, self.max_file_seconds, "File time",
+                         FileBudgetExceeded)
+
+    def check_time(self):
+        now = time.perf_counter()
+        self.check_limit(now - self.file_start, self.max_file_seconds, "File time", FileBudgetExceeded)
+        self.check_limit(now - self.brush_start, self.max_brush_seconds, "Brush time")
+
+    def check_limit(self, value, limit, name, error=BudgetExceeded):
+        if limit is not None and value > limit:
+            raise error(f"{name} limit of {limit} exceeded")
 
 
 class AbrExtractor:
-    def __init__(self, abr_file_path):
+    def __init__(self, abr_file_path, strip_rows=256, max_buffered_bytes=256 * 1024 * 1024,
+                 progress=None, cancel=None, verbose=True, budget=None, workers=1):
         self.abr_file_path = abr_file_path
+        self.strip_rows = strip_rows
+        self.max_buffered_bytes = max_buffered_bytes
+        # progress is called with a psbrushprogress.Progress; setting the
+        # cancel event makes extraction raise ExtractionCancelled.
+        self.progress = progress
+        self.cancel = cancel
+        self.verbose = verbose
+        # With workers > 1 (None for one per CPU) the tips are decoded by a
+        # pool of worker processes; 0 or 1 decodes them in this process.
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.tracker = None
+        self.budget = budget or ResourceBudget()
+        self.file_size = None
         self.brushes = []
 
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def checkpoint(self, f, brushes_done):
+        # Called between brushes: enforces the file limits, starts the next
+        # brush's budget and reports progress.
+        self.budget.check_file()
+        self.budget.check_time()
+        self.budget.start_brush()
+        if self.tracker is not None:
+            self.tracker.update(f.tell(), brushes_done)
+
+    def check_limits(self):
+        if self.tracker is not None:
+            self.tracker.check_cancelled()
+        self.budget.check_time()
+
+    def reserve_tip(self, f, width, height, depth, compress, end, striped=False):
+        # Rejects tips that cannot fit in what is left of their record before
+        # anything is allocated for them. A PackBits packet expands two
+        # bytes into at most 128, so the packed data bounds the tip size.
+        available = end - f.tell()
+        if compress:
+            if height * 2 > available or width * height > 64 * available:
+                raise ValueError(f"{width}x{height} tip does not fit in its {available}-byte record")
+        elif width * height * (depth // 8) > available:
+            raise ValueError(f"{width}x{height} tip does not fit in its {available}-byte record")
+        
+        if not striped:
+            self.budget.allocate(width * height * (1 if compress else max(1, depth // 8)), width * height)
+        else:
+            # Striped tips never hold more than one strip, which is only
+            # charged once it is allocated, but the tip's pixels count now.
+            self.budget.allocate(0, width * height)
+            self.budget.check_limit(self.strip_bytes(width, height, depth, compress),
+                                    self.budget.max_brush_bytes, "Brush byte")
+
+    def strip_bytes(self, width, height, depth, compress):
+        return min(self.strip_rows, height) * width * (1 if compress else depth // 8)
+
     def read_char(self, f):
         data = f.read(1)
         if len(data) != 1:
@@ -47,57 +270,143 @@ class AbrExtractor:
         except UnicodeDecodeError:
             return "Unknown"
 
-    def abr_rle_decode(self, f, height, width):
-        scanline_lengths = []
-        for i in range(height):
-            scanline_lengths.append(self.read_short(f))
+    def read_sample_id(self, f):
+        length = self.read_char(f)
+        data = f.read(length)
+        if len(data) != length:
+            raise EOFError("Unexpected end of file")
+        return data.decode('ascii', errors='replace')
+
+    def read_scanline_lengths(self, f, height, end=None):
+        lengths_data = f.read(height * 2)
+        if len(lengths_data) != height * 2:
+            raise EOFError("Unexpected end of file")
+        scanline_lengths = struct.unpack(f'>{height}h', lengths_data)
+        if end is not None and sum(length for length in scanline_lengths if length > 0) > end - f.tell():
+            raise ValueError("Scanline lengths exceed the brush record")
+        return scanline_lengths
+
+    def abr_rle_decode(self, f, height, width, end=None):
+        scanline_lengths = self.read_scanline_lengths(f, height, end)
 
         buffer = bytearray(height * width)
+        self.rle_decode_rows(f, scanline_lengths, buffer)
+        return buffer
+
+    def rle_decode_rows(self, f, scanline_lengths, buffer):
+        # Decodes PackBits scanlines straight into the caller's buffer. The
+        # packed bytes are read in one go and copied out through memoryview
+        # slices, so no intermediate per-run objects are created.
+        src = f.read(sum(length for length in scanline_lengths if length > 0))
+        src_view = memoryview(src)
+        src_len = len(src)
+        src_pos = 0
+        size = len(buffer)
         data_pos = 0
 
-        for i in range(height):
-            j = 0
-            while j < scanline_lengths[i]:
-                n = self.read_char(f)
-                j += 1
+        for line, length in enumerate(scanline_lengths):
+            if line % 256 == 0:
+                self.check_limits()
+            line_end = src_pos + length
+            while src_pos < line_end:
+                if src_pos >= src_len:
+                    src, src_view, src_len = self._rle_refill(f, src, src_pos + 1)
+                n = src[src_pos]
+                src_pos += 1
 
-                if n >= 128:
-                    n -= 256
+                if n == 128:
+                    continue
 
-                if n < 0:
-                    if n == -128:
-                        continue
-                    
-                    n = -n + 1
-                    ch = self.read_char(f)
-                    j += 1
-
-                    for c in range(n):
-                        if data_pos < len(buffer):
-                            buffer[data_pos] = ch
-                            data_pos += 1
+                if n > 128:
+                    if src_pos >= src_len:
+                        src, src_view, src_len = self._rle_refill(f, src, src_pos + 1)
+                    count = 257 - n
+                    end = min(data_pos + count, size)
+                    buffer[data_pos:end] = RLE_RUNS[src[src_pos]][:end - data_pos]
+                    src_pos += 1
                 else:
-                    for c in range(n + 1):
-                        ch = self.read_char(f)
-                        j += 1
-                        if data_pos < len(buffer):
-                            buffer[data_pos] = ch
-                            data_pos += 1
+                    count = n + 1
+                    if src_pos + count > src_len:
+                        src, src_view, src_len = self._rle_refill(f, src, src_pos + count)
+                    end = min(data_pos + count, size)
+                    buffer[data_pos:end] = src_view[src_pos:src_pos + end - data_pos]
+                    src_pos += count
+                data_pos = end
+
+        return data_pos
+
+    def _rle_refill(self, f, src, needed):
+        # Only reached when a packet runs past the declared scanline lengths.
+        extra = f.read(needed - len(src))
+        if len(src) + len(extra) < needed:
+            raise EOFError("Unexpected end of file")
+        src = bytes(src) + extra
+        return src, memoryview(src), len(src)
+
+    def needs_strips(self, width, height, depth):
+        return height > MAX_BUFFERED_HEIGHT or width * height * max(1, depth // 8) > self.max_buffered_bytes
+
+    def iter_strips(self, f, width, height, depth, compress, end=None):
+        # Yields (buffer, row_count) for consecutive horizontal strips. The
+        # same buffer is reused, so callers must consume it before the next
+        # strip is decoded.
+        if compress:
+            scanline_lengths = self.read_scanline_lengths(f, height, end)
+            stride = width
+        else:
+            stride = width * (depth // 8)
 
-        return bytes(buffer)
+        self.budget.allocate(min(self.strip_rows, height) * stride, 0)
+        buffer = bytearray(min(self.strip_rows, height) * stride)
+        view = memoryview(buffer)
+        for row in range(0, height, self.strip_rows):
+            self.check_limits()
+            row_count = min(self.strip_rows, height - row)
+            strip = view[:row_count * stride]
+            if compress:
+                self.rle_decode_rows(f, scanline_lengths[row:row + row_count], strip)
+            elif f.readinto(strip) != len(strip):
+                raise EOFError("Unexpected end of file")
+            yield strip, row_count
+
+    def save_striped_brush(self, brush, filepath):
+        depth = brush['depth']
+        if depth == 8:
+            mode = 'L'
+        elif depth == 32 and not brush['compress']:
+            mode = 'RGBA'
+        else:
+            raise ValueError(f"Unsupported bit depth {depth} for striped decode")
+
+        writer = PngStreamWriter(filepath, brush['width'], brush['height'], mode)
+        try:
+            with open(self.abr_file_path, 'rb') as f:
+                f.seek(brush['data_offset'])
+                for strip, row_count in self.iter_strips(f, brush['width'], brush['height'],
+                                                         depth, brush['compress'], brush['data_end']):
+                    writer.write_rows(strip, row_count)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
 
     def load_abr_v12(self, f, version, count):
         brushes = []
         
         for i in range(count):
+            self.checkpoint(f, len(brushes))
             try:
                 brush_type = self.read_short(f)
                 brush_size = self.read_long(f)
+                brush_start = f.tell()
+                record_end = brush_start + brush_size
+                if brush_size < 0 or record_end > self.file_size:
+                    raise ValueError(f"Brush record of {brush_size} bytes exceeds the file")
                 
-                print(f"Brush {i+1}: type={brush_type}, size={brush_size}")
+                self.log(f"Brush {i+1}: type={brush_type}, size={brush_size}")
                 
                 if brush_type == 1:
-                    print(f"  Skipping computed brush")
+                    self.log(f"  Skipping computed brush")
                     f.seek(brush_size, 1)
                     continue
                 
@@ -124,24 +433,18 @@ class AbrExtractor:
                     height = bounds_long[2] - bounds_long[0] 
                     width = bounds_long[3] - bounds_long[1]  
                     
-                    print(f"  Sampled brush: {width}x{height}, depth={depth}, spacing={spacing}")
+                    self.log(f"  Sampled brush: {width}x{height}, depth={depth}, spacing={spacing}")
                     if sample_name:
-                        print(f"  Name: {sample_name}")
-                    
-                    if height > 16384:
-                        print(f"  Skipping wide brush (height > 16384)")
-                        continue
+                        self.log(f"  Name: {sample_name}")
                     
                     compress = self.read_char(f)
+                    data_offset = f.tell()
                     
-                    if not compress:
-                        data_size = width * height * (depth // 8)
-                        brush_data = f.read(data_size)
-                        if len(brush_data) != data_size:
-                            print(f"  Warning: Expected {data_size} bytes, got {len(brush_data)}")
-                            continue
-                    else:
-                        brush_data = self.abr_rle_decode(f, height, width)
+                    striped = self.needs_strips(width, height, depth)
+                    self.reserve_tip(f, width, height, depth, compress, record_end, striped)
+                    if striped:
+                        self.log(f"  Large brush, will be decoded in strips")
+                    f.seek(record_end)
                     
                     brush_info = {
                         'index': i + 1,
@@ -150,14 +453,23 @@ class AbrExtractor:
                         'height': height,
                         'depth': depth,
                         'spacing': spacing,
-                        'data': brush_data
+                        'compress': compress,
+                        'data_offset': data_offset,
+                        'data_end': record_end,
+                        'striped': striped,
+                        'data': None
                     }
                     brushes.append(brush_info)
                 
                 else:
-                    print(f"  Skipping unknown brush type {brush_type}")
+                    self.log(f"  Skipping unknown brush type {brush_type}")
                     f.seek(brush_size, 1)
                     
+            except FileBudgetExceeded:
+                raise
+            except BudgetExceeded as e:
+                print(f"Skipping brush {i+1}: {e}")
+                f.seek(record_end)
             except Exception as e:
                 print(f"Error processing brush {i+1}: {e}")
                 break
@@ -166,6 +478,7 @@ class AbrExtractor:
 
     def reach_8bim_section(self, f, section_name):
         while True:
+            self.check_limits()
             try:
                 tag = f.read(4)
                 if len(tag) != 4 or tag != b'8BIM':
@@ -179,7 +492,10 @@ class AbrExtractor:
                     return True
                 
                 section_size = self.read_long(f)
-                f.seek(section_size, 1)
+                section_end = f.tell() + section_size
+                if section_size < 0 or section_end > self.file_size:
+                    return False
+                f.seek(section_end)
                 
             except (EOFError, struct.error):
                 return False
@@ -193,9 +509,13 @@ class AbrExtractor:
         
         sample_section_size = self.read_long(f)
         sample_section_end = f.tell() + sample_section_size
+        if sample_section_size < 0 or sample_section_end > self.file_size:
+            print("'samp' section exceeds the file")
+            return brushes
         
         index = 1
         while f.tell() < sample_section_end:
+            self.checkpoint(f, len(brushes))
             try:
                 brush_size = self.read_long(f)
                 brush_end = brush_size
@@ -206,11 +526,15 @@ class AbrExtractor:
                 
                 next_brush = f.tell() + brush_end
                 
-
+                record_start = f.tell()
+                record_end = record_start + brush_size
+                if brush_size <= 0 or record_end > sample_section_end:
+                    raise ValueError(f"Sample record of {brush_size} bytes exceeds the 'samp' section")
+                sample_id = self.read_sample_id(f)
                 if subversion == 1:
-                    f.seek(47, 1)
+                    f.seek(record_start + 47)
                 else:
-                    f.seek(301, 1)
+                    f.seek(record_start + 301)
                 
                 top = self.read_long(f)
                 left = self.read_long(f)
@@ -218,26 +542,22 @@ class AbrExtractor:
                 right = self.read_long(f)
                 depth = self.read_short(f)
                 compress = self.read_char(f)
+                data_offset = f.tell()
                 
                 width = right - left
                 height = bottom - top
                 
-                print(f"Brush {index}: {width}x{height}, depth={depth}, compressed={bool(compress)}")
+                self.log(f"Brush {index}: {width}x{height}, depth={depth}, compressed={bool(compress)}")
                 
                 if width <= 0 or height <= 0:
-                    print(f"  Invalid dimensions, skipping")
+                    self.log(f"  Invalid dimensions, skipping")
                     f.seek(next_brush)
                     continue
                 
-                if not compress:
-                    data_size = width * height * (depth // 8)
-                    brush_data = f.read(data_size)
-                    if len(brush_data) != data_size:
-                        print(f"  Warning: Expected {data_size} bytes, got {len(brush_data)}")
-                        f.seek(next_brush)
-                        continue
-                else:
-                    brush_data = self.abr_rle_decode(f, height, width)
+                striped = self.needs_strips(width, height, depth)
+                self.reserve_tip(f, width, height, depth, compress, record_end, striped)
+                if striped:
+                    self.log(f"  Large brush, will be decoded in strips")
                 
                 brush_info = {
                     'index': index,
@@ -246,13 +566,24 @@ class AbrExtractor:
                     'height': height,
                     'depth': depth,
                     'spacing': 25, 
-                    'data': brush_data
+                    'sample_id': sample_id,
+                    'compress': compress,
+                    'data_offset': data_offset,
+                    'data_end': record_end,
+                    'striped': striped,
+                    'data': None
                 }
                 brushes.append(brush_info)
                 
                 f.seek(next_brush)
                 index += 1
                 
+            except FileBudgetExceeded:
+                raise
+            except BudgetExceeded as e:
+                print(f"Skipping brush {index}: {e}")
+                f.seek(next_brush)
+                index += 1
             except Exception as e:
                 print(f"Error processing brush {index}: {e}")
                 break
@@ -269,9 +600,13 @@ class AbrExtractor:
         
         sample_section_size = self.read_long(f)
         sample_section_end = f.tell() + sample_section_size
+        if sample_section_size < 0 or sample_section_end > self.file_size:
+            print("'samp' section exceeds the file")
+            return brushes
         
         index = 1
         while f.tell() < sample_section_end:
+            self.checkpoint(f, len(brushes))
             try:
                 brush_size = self.read_long(f)
                 brush_end = brush_size
@@ -281,12 +616,17 @@ class AbrExtractor:
                 
                 next_brush = f.tell() + brush_end
                 
+                record_start = f.tell()
+                record_end = record_start + brush_size
+                if brush_size <= 0 or record_end > sample_section_end:
+                    raise ValueError(f"Sample record of {brush_size} bytes exceeds the 'samp' section")
+                sample_id = self.read_sample_id(f)
                 if subversion == 1:
-                    f.seek(47, 1)  
+                    f.seek(record_start + 47)
                 elif subversion == 2:
-                    f.seek(301, 1)  
+                    f.seek(record_start + 301)
                 else:
-                    start_pos = f.tell()
+                    start_pos = record_start
                     found = False
                     
                     for offset in range(0, min(500, brush_size), 4):
@@ -303,7 +643,7 @@ class AbrExtractor:
                             
                             if (width > 0 and height > 0 and width < 10000 and height < 10000 and 
                                 depth in [1, 8, 16, 24, 32] and top >= 0 and left >= 0):
-                                print(f"  Found brush data at offset {offset}")
+                                self.log(f"  Found brush data at offset {offset}")
                                 found = True
                                 break
                         except:
@@ -321,6 +661,7 @@ class AbrExtractor:
                     right = self.read_long(f)
                     depth = self.read_short(f)
                     compress = self.read_char(f)
+                    data_offset = f.tell()
                 except:
                     print(f"  Error reading brush parameters for brush {index}")
                     f.seek(next_brush)
@@ -329,23 +670,18 @@ class AbrExtractor:
                 width = right - left
                 height = bottom - top
                 
-                print(f"Brush {index}: {width}x{height}, depth={depth}, compressed={bool(compress)}")
+                self.log(f"Brush {index}: {width}x{height}, depth={depth}, compressed={bool(compress)}")
                 
                 if width <= 0 or height <= 0:
-                    print(f"  Invalid dimensions, skipping")
+                    self.log(f"  Invalid dimensions, skipping")
                     f.seek(next_brush)
                     continue
                 
                 try:
-                    if not compress:
-                        data_size = width * height * (depth // 8)
-                        brush_data = f.read(data_size)
-                        if len(brush_data) != data_size:
-                            print(f"  Warning: Expected {data_size} bytes, got {len(brush_data)}")
-                            f.seek(next_brush)
-                            continue
-                    else:
-                        brush_data = self.abr_rle_decode(f, height, width)
+                    striped = self.needs_strips(width, height, depth)
+                    self.reserve_tip(f, width, height, depth, compress, record_end, striped)
+                    if striped:
+                        self.log(f"  Large brush, will be decoded in strips")
                     
                     brush_info = {
                         'index': index,
@@ -354,16 +690,29 @@ class AbrExtractor:
                         'height': height,
                         'depth': depth,
                         'spacing': 25, 
-                        'data': brush_data
+                        'sample_id': sample_id,
+                        'compress': compress,
+                        'data_offset': data_offset,
+                        'data_end': record_end,
+                        'striped': striped,
+                        'data': None
                     }
                     brushes.append(brush_info)
                     
+                except BudgetExceeded:
+                    raise
                 except Exception as e:
                     print(f"  Error reading brush data for brush {index}: {e}")
                 
                 f.seek(next_brush)
                 index += 1
                 
+            except FileBudgetExceeded:
+                raise
+            except BudgetExceeded as e:
+                print(f"Skipping brush {index}: {e}")
+                f.seek(next_brush)
+                index += 1
             except Exception as e:
                 print(f"Error processing brush {index}: {e}")
                 break
@@ -372,11 +721,16 @@ class AbrExtractor:
 
     def extract_brushes(self):
         with open(self.abr_file_path, 'rb') as f:
+            self.file_size = os.fstat(f.fileno()).st_size
+            self.tracker = ProgressTracker('extract', self.file_size, self.progress, self.cancel)
+            self.budget.start_file()
             try:
                 version = self.read_short(f)
                 count = self.read_short(f)
+                if version in [1, 2]:
+                    self.tracker.brushes_total = count
                 
-                print(f"ABR file version: {version}, count/subversion: {count}")
+                self.log(f"ABR file version: {version}, count/subversion: {count}")
                 
                 if version in [1, 2]:
                     self.brushes = self.load_abr_v12(f, version, count)
@@ -392,6 +746,10 @@ class AbrExtractor:
                     print(f"Unsupported ABR version: {version}")
                     return False
                 
+                self.tracker.update(f.tell(), len(self.brushes))
+                self.tracker.finish()
+                self.decode_tips(f)
+                self.budget.check_file()
                 print(f"Successfully extracted {len(self.brushes)} brushes")
                 return True
                 
@@ -399,10 +757,106 @@ class AbrExtractor:
                 print(f"Error reading ABR file: {e}")
                 return False
 
-    def save_brush_images(self, output_dir=None):
+    def decode_tip(self, f, brush):
+        f.seek(brush['data_offset'])
+        if brush['compress']:
+            return self.abr_rle_decode(f, brush['height'], brush['width'], brush['data_end'])
+        
+        data_size = brush['width'] * brush['height'] * (brush['depth'] // 8)
+        brush_data = bytearray(data_size)
+        read_size = f.readinto(brush_data)
+        if read_size != data_size:
+            raise EOFError(f"Expected {data_size} bytes, got {read_size}")
+        return brush_data
+
+    def decode_tips(self, f):
+        # The loaders only locate the tips; they are decoded here in record
+        # order. A tip that fails to decode is dropped, its neighbours keep
+        # their numbers.
+        pending = [brush for brush in self.brushes if not brush['striped']]
+        self.tracker = ProgressTracker('decode', sum(brush['data_end'] - brush['data_offset'] for brush in pending),
+                                       self.progress, self.cancel, len(pending))
+        if self.workers > 1 and len(pending) > 1:
+            results = self.decode_parallel(pending)
+        else:
+            results = self.decode_serial(f, pending)
+        
+        failed = set()
+        bytes_done = 0
+        try:
+            for brush_number, (brush, data, error) in enumerate(results):
+                if error is None:
+                    brush['data'] = data
+                else:
+                    if isinstance(error, BudgetExceeded):
+                        print(f"Skipping brush {brush['index']}: {error}")
+                    else:
+                        print(f"  Error reading brush data for brush {brush['index']}: {error}")
+                    failed.add(id(brush))
+                bytes_done += brush['data_end'] - brush['data_offset']
+                self.tracker.update(bytes_done, brush_number + 1)
+        finally:
+            results.close()
+        self.tracker.finish()
+        self.brushes = [brush for brush in self.brushes if id(brush) not in failed]
+
+    def decode_serial(self, f, pending):
+        for brush in pending:
+            self.budget.start_brush()
+            try:
+                data, error = self.decode_tip(f, brush), None
+            except FileBudgetExceeded:
+                raise
+            except Exception as e:
+                data, error = None, e
+            yield brush, data, error
+
+    def decode_parallel(self, pending):
+        # Each worker process maps the file itself, so only the record
+        # offsets go out. The decoded tips come back pickled, which costs a
+        # transient extra copy of each tip on top of its final buffer here.
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_decode_worker,
+                                 initargs=(self.abr_file_path, self.budget.max_brush_seconds)) as pool:
+            futures = [pool.submit(_decode_tip, brush) for brush in pending]
+            try:
+                for brush, future in zip(pending, futures):
+                    # Keep honouring cancellation and the file time limit
+                    # while a large tip is still being decoded.
+                    while not wait([future], timeout=0.1).done:
+                        self.check_limits()
+                    try:
+                        data, error = future.result(), None
+                    except Exception as e:
+                        data, error = None, e
+                    yield brush, data, error
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def trim_image(self, img, padding=0):
+        # getbbox() scans the pixels in C; for RGBA tips only the alpha
+        # channel decides what is empty.
+        if padding < 0:
+            raise ValueError(f"Trim padding must not be negative, got {padding}")
+        mask = img.getchannel('A') if img.mode == 'RGBA' else img
+        bbox = mask.getbbox()
+        if bbox is None:
+            return img, None
+        
+        left, top, right, bottom = bbox
+        crop = (max(0, left - padding), max(0, top - padding),
+                min(img.width, right + padding), min(img.height, bottom + padding))
+        if crop != (0, 0, img.width, img.height):
+            img = img.crop(crop)
+        return img, crop
+
+    def save_brush_images(self, output_dir=None, trim=False, trim_padding=0):
+        if trim and trim_padding < 0:
+            raise ValueError(f"Trim padding must not be negative, got {trim_padding}")
+        saved = []
         if not self.brushes:
             print("No brushes to save")
-            return
+            return saved
         
         if output_dir is None:
             base_name = os.path.splitext(os.path.basename(self.abr_file_path))[0]
@@ -410,63 +864,117 @@ class AbrExtractor:
         
         os.makedirs(output_dir, exist_ok=True)
         
-        for brush in self.brushes:
+        sizes = [brush['width'] * brush['height'] * max(1, brush['depth'] // 8) for brush in self.brushes]
+        self.tracker = ProgressTracker('save', sum(sizes), self.progress, self.cancel, len(self.brushes))
+        bytes_done = 0
+        
+        # The file budget started in extract_brushes() keeps running here, so
+        # the time and memory limits cover the whole file, not each phase.
+        for brush_number, brush in enumerate(self.brushes):
+            self.budget.start_brush()
+            self.tracker.update(bytes_done, brush_number)
+            bytes_done += sizes[brush_number]
             try:
+                self.budget.check_time()
                 width = brush['width']
                 height = brush['height']
                 depth = brush['depth']
                 data = brush['data']
+                filename = f"{brush['name']}_{brush['index']:03d}.png"
+                filepath = os.path.join(output_dir, filename)
+                
+                if data is None:
+                    self.save_striped_brush(brush, filepath)
+                    brush['file'] = filepath
+                    saved.append(filepath)
+                    self.log(f"Saved: {filepath}")
+                    continue
                 
                 if depth == 8:
                     if len(data) != width * height:
                         print(f"Warning: Data size mismatch for brush {brush['index']}")
                         continue
                     
-                    img = Image.frombytes('L', (width, height), data)
+                    img = Image.frombuffer('L', (width, height), data, 'raw', 'L', 0, 1)
                 elif depth == 32:
                     if len(data) != width * height * 4:
                         print(f"Warning: Data size mismatch for brush {brush['index']}")
                         continue
                     
-                    pixels = []
-                    alpha = []
-                    for i in range(0, len(data), 4):
-                        pixels.extend([data[i], data[i+1], data[i+2]])
-                        alpha.append(data[i+3]) 
-                    
-                    rgb_img = Image.frombytes('RGB', (width, height), bytes(pixels))
-                    alpha_img = Image.frombytes('L', (width, height), bytes(alpha))
-                    img = Image.merge('RGBA', (rgb_img.split()[0], rgb_img.split()[1], rgb_img.split()[2], alpha_img))
+                    img = Image.frombuffer('RGBA', (width, height), data, 'raw', 'RGBA', 0, 1)
                 else:
                     print(f"Unsupported bit depth {depth} for brush {brush['index']}")
                     continue
                 
-                filename = f"{brush['name']}_{brush['index']:03d}.png"
-                filepath = os.path.join(output_dir, filename)
-                img.save(filepath)
-                print(f"Saved: {filepath}")
-                
+                pnginfo = None
+                if trim:
+                    img, crop = self.trim_image(img, trim_padding)
+                    brush['crop'] = crop
+                    if crop is not None:
+                        pnginfo = PngInfo()
+                        pnginfo.add_text('crop', ','.join(str(value) for value in crop))
+                
+                img.save(filepath, pnginfo=pnginfo)
+                brush['file'] = filepath
+                saved.append(filepath)
+                self.log(f"Saved: {filepath}")
+                
+            except FileBudgetExceeded as e:
+                print(f"Stopping at brush {brush['index']}: {e}")
+                break
+            except BudgetExceeded as e:
+                print(f"Skipping brush {brush['index']}: {e}")
             except Exception as e:
                 print(f"Error saving brush {brush['index']}: {e}")
         
+        self.tracker.update(bytes_done, len(self.brushes))
+        self.tracker.finish()
         print(f"Brushes saved to: {output_dir}")
+        return saved
+
+
+_worker_extractor = None
+_worker_mapping = None
+
+def _init_decode_worker(abr_file_path, max_brush_seconds):
+    global _worker_extractor, _worker_mapping
+    _worker_extractor = AbrExtractor(abr_file_path, verbose=False,
+                                     budget=ResourceBudget(max_brush_seconds=max_brush_seconds))
+    with open(abr_file_path, 'rb') as f:
+        _worker_mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _decode_tip(brush):
+    _worker_extractor.budget.start_brush()
+    return _worker_extractor.decode_tip(MappedReader(_worker_mapping), brush)
 
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python psbrushtipextract.py <path_to_abr_file>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Extract brush tip images from a Photoshop .abr file")
+    parser.add_argument('abr_file', help="path to the .abr file")
+    parser.add_argument('--trim', action='store_true', help="crop each tip to its non-empty pixels")
+    parser.add_argument('--trim-padding', type=non_negative_int, default=0, help="pixels of margin to keep around trimmed tips")
+    parser.add_argument('--max-tip-pixels', type=int, default=None, help="reject tips with more pixels than this")
+    parser.add_argument('--max-memory-mb', type=float, default=None,
+                        help="stop once the decoded tips of the file exceed this many MB")
+    parser.add_argument('--timeout', type=float, default=None, help="give up on the file after this many seconds")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes decoding the tips (0 = CPU count, default: 1)")
+    args = parser.parse_args()
     
-    abr_file = sys.argv[1]
+    abr_file = args.abr_file
     
     if not os.path.exists(abr_file):
         print(f"File not found: {abr_file}")
         sys.exit(1)
     
-    extractor = AbrExtractor(abr_file)
+    max_file_bytes = int(args.max_memory_mb * 1024 * 1024) if args.max_memory_mb is not None else None
+    budget = ResourceBudget(max_file_bytes=max_file_bytes, max_file_seconds=args.timeout,
+                            max_brush_pixels=args.max_tip_pixels)
+    extractor = AbrExtractor(abr_file, progress=print_progress_bar, verbose=False, budget=budget,
+                             workers=args.workers or None)
     
     if extractor.extract_brushes():
-        extractor.save_brush_images()
+        extractor.save_brush_images(trim=args.trim, trim_padding=args.trim_padding)
     else:
         print("Failed to extract brushes")
         sys.exit(1)